@@ -10,6 +10,7 @@ import subprocess
 import psycopg2
 import os
 import matplotlib.pyplot as plt
+import search_functions
 
 def get_connection_string(config_file = "database_creds.json"):
     """
@@ -110,8 +111,13 @@ def clear_db(tables = None, config_file = "database_creds.json"):
         if tables == None:
             for table in reversed(meta.sorted_tables):
                 conn.execute(sa.text(f"DROP TABLE IF EXISTS {table} CASCADE;"))
+            conn.execute(sa.text("DROP FUNCTION IF EXISTS kandydat_slownik_sync() CASCADE;"))
             print("Baza danych została wyczyszczona.")
         else:
+            if "kandydat" in [table.lower() for table in tables]:
+                # Słownik wyszukiwania nie ma sensu bez tabeli Kandydat.
+                conn.execute(sa.text("DROP TABLE IF EXISTS Kandydat_slownik;"))
+                conn.execute(sa.text("DROP FUNCTION IF EXISTS kandydat_slownik_sync() CASCADE;"))
             for table in tables:
                 conn.execute(sa.text(f"DROP TABLE IF EXISTS {table} CASCADE;"))
                 print(f"Usunięto tabelę {table}.")
@@ -204,6 +210,8 @@ def denormalize(config_file = "database_creds.json"):
         """))
         
         conn.execute(sa.text("""
+            DROP TABLE IF EXISTS Kandydat_slownik;
+            DROP FUNCTION IF EXISTS kandydat_slownik_sync() CASCADE;
             DROP TABLE Kandydat CASCADE;
             DROP TABLE Wydzial CASCADE;
             DROP TABLE Aplikacja CASCADE;
@@ -279,3 +287,218 @@ def search_candidates(config_file = "database_creds.json", wydzial = None, min_s
     print("\nWyniki wyszukiwania:")
     print(df)
 
+
+def create_search_index(config_file = "database_creds.json"):
+    """
+    Tworzy struktury wykorzystywane przez search_by_name:
+    - słownik Kandydat_slownik z różnymi imionami i nazwiskami kandydatów oraz liczbą ich wystąpień,
+      wraz z indeksem GIN (pg_trgm) do wyszukiwania fragmentów i indeksem w kolacji "C" do wyszukiwania prefiksów,
+    - indeksy tabeli Kandydat na parach (nazwisko, imie) oraz (imie, nazwisko) z numerem PESEL,
+    - indeks na numerze PESEL dla wyszukiwania po prefiksie,
+    - wyzwalacz utrzymujący słownik w zgodności z tabelą Kandydat.
+    Funkcję należy wywołać po normalizacji bazy, ponowne wywołanie odświeża słownik i statystyki.
+    """
+    connection_string = get_connection_string(config_file)
+
+    engine = sa.create_engine(connection_string)
+
+    with engine.begin() as conn:
+        conn.execute(sa.text("CREATE EXTENSION IF NOT EXISTS pg_trgm;"))
+        conn.execute(sa.text("""
+            CREATE TABLE IF NOT EXISTS Kandydat_slownik (
+                kolumna VARCHAR(10) NOT NULL,
+                wartosc VARCHAR(100) NOT NULL,
+                liczba INTEGER NOT NULL,
+
+                PRIMARY KEY (kolumna, wartosc)
+            );
+        """))
+        conn.execute(sa.text("""
+            CREATE INDEX IF NOT EXISTS idx_kandydat_slownik_trgm
+            ON Kandydat_slownik USING gin (wartosc gin_trgm_ops);
+        """))
+        # Prefiksy wyszukiwane są jako przedziały w porządku binarnym (kolacja "C").
+        conn.execute(sa.text("""
+            CREATE INDEX IF NOT EXISTS idx_kandydat_slownik_c
+            ON Kandydat_slownik (kolumna, wartosc COLLATE "C") INCLUDE (liczba);
+        """))
+        # Numer PESEL w indeksach pozwala sprawdzać warunki na imieniu i nazwisku bez odczytu wierszy tabeli.
+        conn.execute(sa.text("""
+            CREATE INDEX IF NOT EXISTS idx_kandydat_nazwisko_imie
+            ON Kandydat (nazwisko, imie) INCLUDE (pesel);
+        """))
+        conn.execute(sa.text("""
+            CREATE INDEX IF NOT EXISTS idx_kandydat_imie_nazwisko
+            ON Kandydat (imie, nazwisko) INCLUDE (pesel);
+        """))
+        # Kolacja "C" pozwala użyć tego samego indeksu dla LIKE 'prefiks%' i dla ORDER BY.
+        conn.execute(sa.text("""
+            CREATE INDEX IF NOT EXISTS idx_kandydat_pesel_c
+            ON Kandydat (pesel COLLATE "C");
+        """))
+
+        # Wartość trafia do słownika przy pierwszym wystąpieniu i jest z niego usuwana,
+        # gdy żaden kandydat już jej nie używa. Liczba wystąpień służy jedynie do wyboru
+        # indeksu przy wyszukiwaniu, więc wystarcza jej przybliżona wartość.
+        conn.execute(sa.text("""
+            CREATE OR REPLACE FUNCTION kandydat_slownik_sync() RETURNS trigger AS $$
+            BEGIN
+                IF TG_OP IN ('DELETE', 'UPDATE') THEN
+                    UPDATE Kandydat_slownik SET liczba = liczba - 1
+                    WHERE (kolumna, wartosc) IN (('imie', OLD.imie), ('nazwisko', OLD.nazwisko));
+                    DELETE FROM Kandydat_slownik
+                    WHERE kolumna = 'imie' AND wartosc = OLD.imie
+                    AND NOT EXISTS (SELECT 1 FROM Kandydat WHERE imie = OLD.imie);
+                    DELETE FROM Kandydat_slownik
+                    WHERE kolumna = 'nazwisko' AND wartosc = OLD.nazwisko
+                    AND NOT EXISTS (SELECT 1 FROM Kandydat WHERE nazwisko = OLD.nazwisko);
+                END IF;
+                IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                    INSERT INTO Kandydat_slownik (kolumna, wartosc, liczba)
+                    VALUES ('imie', NEW.imie, 1), ('nazwisko', NEW.nazwisko, 1)
+                    ON CONFLICT (kolumna, wartosc) DO UPDATE SET liczba = Kandydat_slownik.liczba + 1;
+                END IF;
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql;
+        """))
+        conn.execute(sa.text("DROP TRIGGER IF EXISTS kandydat_slownik_sync ON Kandydat;"))
+        conn.execute(sa.text("""
+            CREATE TRIGGER kandydat_slownik_sync
+            AFTER INSERT OR DELETE OR UPDATE OF imie, nazwisko ON Kandydat
+            FOR EACH ROW EXECUTE FUNCTION kandydat_slownik_sync();
+        """))
+
+        conn.execute(sa.text("TRUNCATE Kandydat_slownik;"))
+        conn.execute(sa.text("""
+            INSERT INTO Kandydat_slownik (kolumna, wartosc, liczba)
+            SELECT 'imie', imie, count(*) FROM Kandydat GROUP BY imie
+            UNION ALL
+            SELECT 'nazwisko', nazwisko, count(*) FROM Kandydat GROUP BY nazwisko;
+        """))
+        # Wiersze dodane do indeksu GIN trafiają najpierw na listę oczekujących, przeszukiwaną sekwencyjnie.
+        conn.execute(sa.text("SELECT gin_clean_pending_list('idx_kandydat_slownik_trgm');"))
+        conn.execute(sa.text("ANALYZE Kandydat;"))
+        conn.execute(sa.text("ANALYZE Kandydat_slownik;"))
+
+    print("Indeksy wyszukiwania zostały utworzone.")
+
+def _dictionary_query(kolumna, slowo, tryb, parametr):
+    """
+    Zwraca zapytanie o wiersze (wartosc, liczba) słownika kolumny, do których słowo
+    pasuje w podanym trybie lub lepiej (0 - równe, 1 - prefiks, 2 - fragment), i jego parametry.
+    Fragment wyszukiwany jest w indeksie trigramowym słownika, prefiks jako przedziały indeksu
+    w kolacji "C" dla każdego wariantu wielkości liter dwóch pierwszych znaków.
+    """
+    params = {f"{parametr}_kolumna": kolumna, f"{parametr}_wzorzec": search_functions.regex_pattern(slowo, tryb)}
+    if tryb == 2:
+        query = f"""
+            SELECT wartosc, liczba FROM Kandydat_slownik
+            WHERE kolumna = :{parametr}_kolumna AND wartosc ~ :{parametr}_wzorzec
+        """
+        return query, params
+
+    zakresy = []
+    for i, (od, do) in enumerate(search_functions.prefix_ranges(slowo)):
+        zakresy.append(f"""
+            SELECT wartosc, liczba FROM Kandydat_slownik
+            WHERE kolumna = :{parametr}_kolumna
+                AND wartosc COLLATE "C" >= :{parametr}_od{i} AND wartosc COLLATE "C" < :{parametr}_do{i}
+                AND wartosc ~ :{parametr}_wzorzec
+        """)
+        params[f"{parametr}_od{i}"] = od
+        params[f"{parametr}_do{i}"] = do
+    return " UNION ALL ".join(zakresy), params
+
+def _match_condition(wyrazenie, slowo, tryb, parametr):
+    """
+    Zwraca warunek SQL dopasowania słowa do wartości wyrażenia w podanym trybie i jego parametry.
+    """
+    return f"{wyrazenie} ~ :{parametr}", {parametr: search_functions.regex_pattern(slowo, tryb)}
+
+def _search_by_name(conn, fraza, limit):
+    """
+    Zwraca wiersze wyników search_by_name. Fraza złożona z jednej liczby jest prefiksem PESEL,
+    pozostałe frazy wyszukiwane są przez search_functions.search_rows.
+    """
+    columns = """
+    SELECT k.PESEL, k.imie, k.nazwisko, k.sredniamaturalna, w.nazwawydzialu, a.statusaplikacji
+    FROM Kandydat k
+    LEFT JOIN Aplikacja a ON k.PESEL = a.PESEL
+    LEFT JOIN Wydzial w ON a.IDwydzialu = w.IDwydzialu
+    """
+
+    slowa = fraza.split()
+    if len(slowa) == 1 and slowa[0].isdigit():
+        query = columns + ' WHERE k.pesel COLLATE "C" LIKE :wzorzec ORDER BY k.pesel COLLATE "C" LIMIT :limit'
+        return conn.execute(sa.text(query), {"wzorzec": slowa[0] + "%", "limit": limit}).fetchall()
+
+    # Tablica wartości pozwala przeglądać indeks w kolejności sortowania i zakończyć po osiągnięciu limitu.
+    return search_functions.search_rows(conn, fraza, limit, columns, _dictionary_query, _match_condition,
+                                        zbior = "k.{kolumna} = ANY(ARRAY({zapytanie}))")
+
+def _like_search_query(fraza, limit):
+    """
+    Zwraca zapytanie i parametry wyszukiwania kandydatów za pomocą LIKE,
+    bez użycia indeksów. Używana jako punkt odniesienia w benchmark_search.
+    """
+    slowa = fraza.split()
+    query = """
+    SELECT k.PESEL, k.imie, k.nazwisko, k.sredniamaturalna, w.nazwawydzialu, a.statusaplikacji
+    FROM Kandydat k
+    LEFT JOIN Aplikacja a ON k.PESEL = a.PESEL
+    LEFT JOIN Wydzial w ON a.IDwydzialu = w.IDwydzialu
+    """
+
+    # Wyrażenia różnią się od indeksowanych, więc planista wykonuje pełny skan tabeli.
+    if len(slowa) == 1 and slowa[0].isdigit():
+        query += " WHERE CAST(k.pesel AS TEXT) LIKE :slowo0 || '%'"
+    else:
+        query += " WHERE " + " AND ".join(
+            f"concat_ws(' ', k.imie, k.nazwisko) ILIKE :slowo{i} ESCAPE '\\'" for i in range(len(slowa)))
+    query += " LIMIT :limit"
+
+    params = {f"slowo{i}": "%" + search_functions.escape_like(slowo) + "%" for i, slowo in enumerate(slowa)}
+    params["limit"] = limit
+    return query, params
+
+def search_by_name(fraza, limit = 20, config_file = "database_creds.json"):
+    """
+    Wyszukuje kandydatów po fragmentach imienia i nazwiska (bez względu na wielkość liter)
+    albo po prefiksie numeru PESEL. Wyniki są uszeregowane według trafności
+    (zob. search_functions.search_rows) i ograniczone do podanej liczby wierszy.
+    Wymaga wcześniejszego wywołania create_search_index.
+    """
+    connection_string = get_connection_string(config_file)
+
+    engine = sa.create_engine(connection_string)
+
+    with engine.connect() as conn:
+        wiersze = _search_by_name(conn, fraza, limit)
+
+    df = pd.DataFrame(wiersze, columns = ["pesel", "imie", "nazwisko", "sredniamaturalna",
+                                          "nazwawydzialu", "statusaplikacji"])
+
+    print("\nWyniki wyszukiwania:")
+    print(df)
+    return df
+
+def benchmark_search(frazy = search_functions.BENCHMARK_PHRASES, limit = 20, repeats = 20,
+                     config_file = "database_creds.json"):
+    """
+    Porównuje czas wyszukiwania przez search_by_name z wyszukiwaniem za pomocą ILIKE '%...%'.
+    Dla każdej frazy podaje medianę czasu w milisekundach z podanej liczby powtórzeń
+    oraz liczbę zwróconych wierszy. Domyślne frazy obejmują rzadkie imiona z częstymi fragmentami
+    nazwisk (np. "Łucja ski"), które przy dużej liczbie różnych nazwisk są najtrudniejsze dla indeksu.
+    Wymaga wcześniejszego wywołania create_search_index.
+    """
+    connection_string = get_connection_string(config_file)
+
+    engine = sa.create_engine(connection_string)
+
+    with engine.connect() as conn:
+        df = search_functions.benchmark_rows(conn, frazy, limit, repeats, _search_by_name, _like_search_query)
+
+    print("\nCzas wyszukiwania [ms]:")
+    print(df)
+    return df
@@ -0,0 +1,322 @@
+"""
+Moduł zawiera część wyszukiwania kandydatów po imieniu i nazwisku wspólną dla baz PostgreSQL i SQLite:
+dopasowanie słów frazy bez względu na wielkość liter, ocenę jakości dopasowania i kolejność wyników.
+Moduły bazodanowe dostarczają jedynie przeszukiwanie słownika imion i nazwisk oraz składnię zapytań.
+"""
+
+import itertools
+import re
+import time
+import pandas as pd
+import sqlalchemy as sa
+
+# Maksymalna liczba wartości słownika wczytywanych dla jednego słowa frazy.
+# Słowa o większej liczbie trafień są sprawdzane wyłącznie w zapytaniu do tabeli Kandydat.
+LIMIT_SLOWNIKA = 1000
+
+# Minimalna długość słowa dopasowywanego jako fragment; krótsze słowa dopasowywane są jako prefiks.
+DLUGOSC_FRAGMENTU = 3
+
+# Przybliżony koszt wyszukania wartości w indeksie, wyrażony w liczbie przeglądanych w zamian wierszy.
+KOSZT_WYSZUKANIA = 4
+
+BENCHMARK_PHRASES = ["Kowal", "Nowak", "Stępień", "owals", "Ko", "łu", "ski", "owa",
+                     "Anna Kowal", "Kowalska A", "Jan Ko", "Łucja ski", "Łucja ska", "Łucja Nowa",
+                     "Anna ski", "Anna ska", "100%", "xyzq", "0123", "5"]
+
+def case_variants(znak):
+    """
+    Zwraca posortowane warianty znaku różniące się wielkością liter.
+    """
+    return sorted(wariant for wariant in {znak, znak.lower(), znak.upper()} if len(wariant) == 1)
+
+def glob_pattern(slowo, tryb):
+    """
+    Zwraca wzorzec GLOB dopasowujący słowo bez względu na wielkość liter:
+    0 - całą wartość, 1 - jej prefiks, 2 - dowolny fragment.
+    """
+    czesci = []
+    for znak in slowo:
+        warianty = case_variants(znak)
+        if len(warianty) > 1 or znak in "*?[":
+            czesci.append("[" + "".join(warianty) + "]")
+        else:
+            czesci.append(znak)
+    wzorzec = "".join(czesci)
+    return {0: wzorzec, 1: wzorzec + "*", 2: "*" + wzorzec + "*"}[tryb]
+
+def regex_pattern(slowo, tryb):
+    """
+    Zwraca wyrażenie regularne (zgodne z PostgreSQL i modułem re) dopasowujące słowo
+    bez względu na wielkość liter, w tych samych trybach co glob_pattern.
+    """
+    czesci = []
+    for znak in slowo:
+        warianty = case_variants(znak)
+        znaki = "".join(wariant if wariant.isalnum()
+                        else f"\\u{ord(wariant):04x}" if ord(wariant) <= 0xFFFF
+                        else f"\\U{ord(wariant):08x}"
+                        for wariant in warianty)
+        czesci.append("[" + znaki + "]" if len(warianty) > 1 else znaki)
+    wzorzec = "".join(czesci)
+    return {0: "^" + wzorzec + "$", 1: "^" + wzorzec, 2: wzorzec}[tryb]
+
+def prefix_ranges(slowo):
+    """
+    Zwraca przedziały [od, do) w porządku binarnym obejmujące wartości zaczynające się od słowa
+    bez względu na wielkość liter - po jednym dla każdego wariantu wielkości dwóch pierwszych znaków.
+    """
+    przedzialy = []
+    for poczatek in itertools.product(*map(case_variants, slowo[:2])):
+        poczatek = "".join(poczatek)
+        przedzialy.append((poczatek, poczatek[:-1] + chr(ord(poczatek[-1]) + 1)))
+    return przedzialy
+
+def escape_like(slowo):
+    """
+    Poprzedza znakiem '\\' symbole specjalne wzorca LIKE, aby były dopasowywane dosłownie.
+    """
+    return slowo.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+def _highest_mode(slowo):
+    """
+    Zwraca najsłabszy tryb dopasowania słowa: fragment dla słów od DLUGOSC_FRAGMENTU znaków, prefiks dla krótszych.
+    """
+    return 2 if len(slowo) >= DLUGOSC_FRAGMENTU else 1
+
+def search_rows(conn, fraza, limit, kolumny, slownik, dopasowanie, zbior = "k.{kolumna} IN ({zapytanie})"):
+    """
+    Zwraca wiersze kandydatów, których imię lub nazwisko pasuje do każdego słowa frazy:
+    słowa od DLUGOSC_FRAGMENTU znaków jako fragment, krótsze jako prefiks, bez względu na wielkość liter.
+    Wyniki są uporządkowane według oceny dopasowania nazwiska, następnie imienia
+    (0 - równe, 1 - prefiks, 2 - fragment, 3 - brak), a w ich obrębie według nazwiska i imienia.
+
+    Dla każdej pary ocen wykonywane jest jedno zapytanie, w którym kolumna o ocenie innej niż 3
+    należy do zbioru wartości słownika o tej ocenie (nazwisko IN (...) AND imie IN (...)).
+    Z każdego zapytania do słownika wczytywanych jest co najwyżej LIMIT_SLOWNIKA wartości;
+    przy większej liczbie trafień zbiór wyznacza podzapytanie do słownika. Zbiór bardzo wielu
+    wartości zawierających fragment zastępowany jest warunkiem na wierszach, jeśli tańsze jest
+    przeglądanie indeksu w kolejności sortowania.
+
+    Parametry zależne od bazy danych:
+    - kolumny: początek zapytania (SELECT ... FROM Kandydat k ...),
+    - slownik(kolumna, slowo, tryb, parametr): zapytanie zwracające wartości (wartosc, liczba)
+      słownika kolumny, do których słowo pasuje w podanym trybie lub lepiej, i jego parametry,
+    - dopasowanie(wyrazenie, slowo, tryb, parametr): warunek SQL "słowo pasuje do wartości wyrażenia
+      w podanym trybie" i jego parametry,
+    - zbior: warunek "wartość kolumny należy do wyniku zapytania" (pola kolumna i zapytanie).
+    Nazwy parametrów zapytań zaczynają się od podanego prefiksu parametr.
+    Słownik musi być dostępny także jako tabela Kandydat_slownik(kolumna, wartosc).
+    Złączenia z kolumn wykonywane są dopiero dla wierszy wybranych z tabeli Kandydat.
+    """
+    slowa = fraza.split()
+    if not slowa:
+        raise ValueError("Fraza wyszukiwania nie może być pusta.")
+
+    kolumny_slownika = ("nazwisko", "imie")
+    wyrazenia = [[re.compile(regex_pattern(slowo, tryb)) for tryb in range(_highest_mode(slowo) + 1)]
+                 for slowo in slowa]
+
+    # Dla każdej kolumny: wczytane wartości słownika (wartość -> liczba kandydatów), wartości pasujące
+    # do poszczególnych słów, jeśli wczytano je w całości, oraz zapytania do słownika, które przekroczyły
+    # limit (numer słowa, tryb, zapytanie, szacunek liczby kandydatów).
+    wartosci = {kolumna: {} for kolumna in kolumny_slownika}
+    pelne = {kolumna: {} for kolumna in kolumny_slownika}
+    podzapytania = {kolumna: [] for kolumna in kolumny_slownika}
+    params = {}
+
+    for i, slowo in enumerate(slowa):
+        for kolumna in kolumny_slownika:
+            for tryb in range(_highest_mode(slowo), -1, -1):
+                zapytanie, zapytanie_params = slownik(kolumna, slowo, tryb, f"{kolumna}_{i}_{tryb}")
+                wiersze = conn.execute(sa.text(f"SELECT wartosc, liczba FROM ({zapytanie}) AS slownik LIMIT :limit"),
+                                       {**zapytanie_params, "limit": LIMIT_SLOWNIKA + 1}).fetchall()
+                if len(wiersze) <= LIMIT_SLOWNIKA:
+                    wartosci[kolumna].update(wiersze)
+                    if tryb == _highest_mode(slowo):
+                        pelne[kolumna][i] = [w for w, _ in wiersze if wyrazenia[i][-1].search(w)]
+                    break
+                # Łączna liczba kandydatów wczytanych wartości szacuje od dołu rozmiar podzapytania.
+                podzapytania[kolumna].append((i, tryb, zapytanie, sum(liczba for _, liczba in wiersze)))
+                params.update(zapytanie_params)
+
+        if all(pelne[kolumna].get(i) == [] for kolumna in kolumny_slownika):
+            # Słowo nie pasuje do żadnego imienia ani nazwiska.
+            return []
+
+    # Dla wczytanych wartości: najlepsza ocena dopasowania do słów frazy i numery pasujących słów.
+    oceny = {kolumna: {} for kolumna in kolumny_slownika}
+    slowa_wartosci = {kolumna: {} for kolumna in kolumny_slownika}
+    for kolumna in kolumny_slownika:
+        for wartosc in wartosci[kolumna]:
+            oceny[kolumna][wartosc] = min((tryb for wzorce in wyrazenia for tryb, wzorzec in enumerate(wzorce)
+                                           if wzorzec.search(wartosc)), default = 3)
+            slowa_wartosci[kolumna][wartosc] = {i for i, wzorce in enumerate(wyrazenia) if wzorce[-1].search(wartosc)}
+
+    # Zbiór wartości kolumny to para (lista wartości, podzapytania (numer słowa, tryb, zapytanie, szacunek)).
+    def zbiory(kolumna, poziom, wymagane):
+        # Zbiory zawierające wszystkie wartości kolumny o danej ocenie, pasujące do wymaganych słów.
+        # Listy zawierają tylko takie wartości, wyniki podzapytań należy przefiltrować.
+        def lista(zrodlo):
+            return {w: wartosci[kolumna][w] for w in zrodlo
+                    if oceny[kolumna][w] == poziom and slowa_wartosci[kolumna][w].issuperset(wymagane)}
+
+        # Wartość o ocenie poziom pasuje w tym trybie do któregoś ze słów, więc brakujące w liście
+        # zwracają zapytania do słownika w tym trybie.
+        wynik = [(lista(wartosci[kolumna]), [z for z in podzapytania[kolumna] if z[1] == poziom])]
+        # Wartości pasujące do wymaganych słów zawiera wynik zapytania o dowolne z nich.
+        for i in wymagane:
+            slowo = slowa[i]
+            if i in pelne[kolumna]:
+                wynik.append((lista(pelne[kolumna][i]), []))
+            wynik += [({}, [z]) for z in podzapytania[kolumna] if z[0] == i and z[1] == _highest_mode(slowo)]
+        return wynik
+
+    def szacunek(zbior_wartosci):
+        # Liczba kandydatów, których wartość należy do zbioru (dla podzapytań szacowana od dołu).
+        wartosci_listy, zapytania = zbior_wartosci
+        return sum(wartosci_listy.values()) + sum(n for _, _, _, n in zapytania)
+
+    def gesty(zbior_wartosci):
+        # Zbiór ponad LIMIT_SLOWNIKA wartości zawierających fragment.
+        return any(tryb == 2 for _, tryb, _, _ in zbior_wartosci[1])
+
+    def pasuje(wyrazenie, poziom):
+        # Warunek: wartość wyrażenia pasuje do któregoś ze słów z oceną nie gorszą niż poziom.
+        czesci = []
+        for i, slowo in enumerate(slowa):
+            tryb = min(poziom, _highest_mode(slowo))
+            warunek, warunek_params = dopasowanie(wyrazenie, slowo, tryb, f"s{i}_{tryb}")
+            czesci.append(warunek)
+            params.update(warunek_params)
+        return "(" + " OR ".join(czesci) + ")"
+
+    def poziom_rowny(wyrazenie, poziom, dopasowane = False):
+        # Warunki: najlepsza ocena dopasowania wartości wyrażenia do słów frazy jest równa poziom.
+        # Przy dopasowane wiadomo już, że ocena jest nie gorsza niż poziom.
+        warunki = []
+        if poziom < 3 and not dopasowane:
+            warunki.append(pasuje(wyrazenie, poziom))
+        if poziom > 0:
+            warunki.append("NOT " + pasuje(wyrazenie, poziom - 1))
+        return warunki
+
+    def pokrywa(wyrazenie, i):
+        # Warunek: słowo i pasuje do wartości wyrażenia.
+        tryb = _highest_mode(slowa[i])
+        warunek, warunek_params = dopasowanie(wyrazenie, slowa[i], tryb, f"s{i}_{tryb}")
+        params.update(warunek_params)
+        return warunek
+
+    wyniki = []
+
+    for poziom_nazwiska in range(4):
+        for poziom_imienia in range(4):
+            if len(wyniki) >= limit:
+                return wyniki
+            if poziom_nazwiska == poziom_imienia == 3:
+                continue
+            poziomy = {"nazwisko": poziom_nazwiska, "imie": poziom_imienia}
+            drugie = {"nazwisko": "imie", "imie": "nazwisko"}
+
+            # Słowa, do których musi pasować kolumna, bo nie pasuje do nich żadna wartość drugiej kolumny.
+            wymagane = {}
+            for kolumna in kolumny_slownika:
+                druga, poziom = drugie[kolumna], poziomy[drugie[kolumna]]
+                wartosci_drugiej, zapytania = zbiory(druga, poziom, [])[0] if poziom < 3 else ({}, [])
+                wymagane[kolumna] = [i for i in range(len(slowa)) if poziom == 3 or not zapytania
+                                     and not any(i in slowa_wartosci[druga][w] for w in wartosci_drugiej)]
+
+            # Dla każdej kolumny zbiór wartości obejmujący najmniej kandydatów, jeśli to możliwe bez fragmentów.
+            wybrane = {kolumna: min(zbiory(kolumna, poziom, wymagane[kolumna]), key = lambda z: (gesty(z), szacunek(z)))
+                       for kolumna, poziom in poziomy.items() if poziom < 3}
+            if any(not w and not z for w, z in wybrane.values()):
+                # Żadna wartość kolumny nie ma wymaganej oceny.
+                continue
+
+            # Zbiór wielu wartości z fragmentem opłaca się, gdy pozwala szukać w indeksie obu kolumn
+            # taniej niż przeglądanie kandydatów z drugiego zbioru albo gdy fraza ma kilka słów.
+            uzyte = {}
+            for kolumna, zbior_wartosci in wybrane.items():
+                drugi = wybrane.get(drugie[kolumna])
+                if not gesty(zbior_wartosci):
+                    uzyte[kolumna] = zbior_wartosci
+                elif drugi is not None and not gesty(drugi):
+                    wartosci_zbioru = len(zbior_wartosci[0]) + (LIMIT_SLOWNIKA + 1) * len(zbior_wartosci[1])
+                    if KOSZT_WYSZUKANIA * wartosci_zbioru < szacunek(drugi):
+                        uzyte[kolumna] = zbior_wartosci
+                elif len(slowa) > 1:
+                    uzyte[kolumna] = zbior_wartosci
+
+            warunki = []
+            lista_params = {}
+            for kolumna, poziom in poziomy.items():
+                wyrazenie = f"k.{kolumna}"
+                if kolumna not in uzyte:
+                    warunki.extend(poziom_rowny(wyrazenie, poziom))
+                    continue
+                wartosci_listy, zapytania = uzyte[kolumna]
+                lista = f"lista_{kolumna}"
+                if wartosci_listy:
+                    lista_params[lista] = list(wartosci_listy)
+                if not zapytania:
+                    warunki.append(f"{wyrazenie} IN :{lista}")
+                    continue
+                zrodla = []
+                for j, tryb, z, _ in zapytania:
+                    # Podzapytanie zwraca wartości pasujące do słowa j w trybie tryb lub lepiej,
+                    # więc pomijane są wynikające z tego warunki.
+                    filtr = poziom_rowny("slownik.wartosc", poziom, tryb <= poziom)
+                    filtr += [pokrywa("slownik.wartosc", i) for i in wymagane[kolumna] if i != j]
+                    zrodlo = f"SELECT wartosc FROM ({z}) AS slownik"
+                    if filtr:
+                        zrodlo += " WHERE " + " AND ".join(filtr)
+                    zrodla.append(zrodlo)
+                if wartosci_listy:
+                    zrodla.append(f"SELECT wartosc FROM Kandydat_slownik WHERE kolumna = '{kolumna}' "
+                                  f"AND wartosc IN :{lista}")
+                warunki.append(zbior.format(kolumna = kolumna, zapytanie = " UNION ALL ".join(zrodla)))
+
+            # Każde słowo musi pasować do imienia lub nazwiska. Wynika to z ocen, gdy fraza ma jedno słowo,
+            # ze zbioru wartości, gdy słowo jest wymagane, albo gdy pasuje do całej listy wartości.
+            for i in range(len(slowa)):
+                if len(slowa) == 1 or any(
+                        kolumna in uzyte and (i in wymagane[kolumna] or not uzyte[kolumna][1]
+                                              and all(i in slowa_wartosci[kolumna][w] for w in uzyte[kolumna][0]))
+                        for kolumna in kolumny_slownika):
+                    continue
+                warunki.append("(" + " OR ".join(pokrywa(f"k.{kolumna}", i) for kolumna in kolumny_slownika) + ")")
+
+            query = sa.text(kolumny + " WHERE k.pesel IN (SELECT k.pesel FROM Kandydat k WHERE " + " AND ".join(warunki)
+                            + " ORDER BY k.nazwisko, k.imie LIMIT :limit) ORDER BY k.nazwisko, k.imie")
+            query = query.bindparams(*(sa.bindparam(nazwa, expanding = True) for nazwa in lista_params))
+            wyniki.extend(conn.execute(query, {**params, **lista_params, "limit": limit - len(wyniki)}).fetchall())
+
+    return wyniki
+
+def benchmark_rows(conn, frazy, limit, repeats, szukaj, like_query):
+    """
+    Mierzy czas wyszukiwania funkcją szukaj(conn, fraza, limit) oraz zapytaniem zwracanym
+    przez like_query(fraza, limit). Dla każdej frazy podaje medianę czasu w milisekundach
+    z podanej liczby powtórzeń oraz liczbę zwróconych wierszy.
+    """
+    wyniki = []
+
+    for fraza in frazy:
+        query, params = like_query(fraza, limit)
+        metody = (
+            ("indeks", lambda: szukaj(conn, fraza, limit)),
+            ("like", lambda: conn.execute(sa.text(query), params).fetchall())
+        )
+        wiersz = {"fraza": fraza}
+        for nazwa, metoda in metody:
+            czasy = []
+            for _ in range(repeats):
+                start = time.perf_counter()
+                liczba = len(metoda())
+                czasy.append((time.perf_counter() - start) * 1000)
+            wiersz[f"{nazwa}_ms"] = sorted(czasy)[len(czasy) // 2]
+            wiersz[f"{nazwa}_wiersze"] = liczba
+        wyniki.append(wiersz)
+
+    return pd.DataFrame(wyniki)
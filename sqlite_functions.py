@@ -8,6 +8,7 @@ import json
 import sqlalchemy as sa
 import shutil
 import matplotlib.pyplot as plt
+import search_functions
 
 def table_to_json(db_path, table, json_file):
     """
@@ -56,10 +57,16 @@ def clear_db(db_file, tables = None):
 
     with engine.begin() as conn:
         if tables == None:
+            # Tabela FTS5 musi zostać usunięta przed swoimi tabelami pomocniczymi.
+            conn.execute(sa.text("DROP TABLE IF EXISTS Kandydat_fts;"))
             for table in reversed(meta.sorted_tables):
                 conn.execute(sa.text(f"DROP TABLE IF EXISTS {table};"))
             print("Baza danych została wyczyszczona.")
         else:
+            if "kandydat" in [table.lower() for table in tables]:
+                # Indeks wyszukiwania nie ma sensu bez tabeli Kandydat.
+                conn.execute(sa.text("DROP TABLE IF EXISTS Kandydat_fts;"))
+                conn.execute(sa.text("DROP TABLE IF EXISTS Kandydat_slownik;"))
             for table in tables:
                 conn.execute(sa.text(f"DROP TABLE IF EXISTS {table};"))
                 print(f"Usunięto tabelę {table}.")
@@ -151,6 +158,8 @@ def denormalize(db_file):
             JOIN Wydzial w ON a.idwydzialu = w.idwydzialu;
         """))
         
+        conn.execute(sa.text("DROP TABLE IF EXISTS Kandydat_fts;"))
+        conn.execute(sa.text("DROP TABLE IF EXISTS Kandydat_slownik;"))
         conn.execute(sa.text("DROP TABLE Kandydat;"))
         conn.execute(sa.text("DROP TABLE Wydzial;"))
         conn.execute(sa.text("DROP TABLE Aplikacja;"))
@@ -220,3 +229,230 @@ def search_candidates(db_file, wydzial = None, min_sred = None, status = None):
 
     print("\nWyniki wyszukiwania:")
     print(df)
+
+def create_search_index(db_file):
+    """
+    Tworzy struktury wykorzystywane przez search_by_name:
+    - słownik Kandydat_slownik z różnymi imionami i nazwiskami kandydatów oraz liczbą ich wystąpień,
+    - tabelę wirtualną FTS5 (tokenizer trigram) indeksującą ten słownik,
+    - indeksy tabeli Kandydat na parach (nazwisko, imie) oraz (imie, nazwisko),
+    - wyzwalacze utrzymujące słownik i tabelę FTS5 w zgodności z tabelą Kandydat.
+    Wyszukiwanie po prefiksie PESEL korzysta z klucza głównego tabeli Kandydat.
+    Funkcję należy wywołać po normalizacji bazy, ponowne wywołanie odświeża słownik i statystyki.
+    """
+    engine = sa.create_engine(f"sqlite:///{db_file}")
+
+    with engine.begin() as conn:
+        conn.execute(sa.text("""
+            CREATE TABLE IF NOT EXISTS Kandydat_slownik (
+                id INTEGER PRIMARY KEY,
+                kolumna TEXT NOT NULL,
+                wartosc TEXT NOT NULL,
+                liczba INTEGER NOT NULL,
+                imie TEXT GENERATED ALWAYS AS (CASE WHEN kolumna = 'imie' THEN wartosc END) VIRTUAL,
+                nazwisko TEXT GENERATED ALWAYS AS (CASE WHEN kolumna = 'nazwisko' THEN wartosc END) VIRTUAL,
+                UNIQUE (kolumna, wartosc)
+            );
+        """))
+        # Osobne kolumny FTS5 dla imion i nazwisk pozwalają przeszukiwać każdą z nich niezależnie.
+        conn.execute(sa.text("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS Kandydat_fts USING fts5(
+                imie,
+                nazwisko,
+                content = 'Kandydat_slownik',
+                content_rowid = 'id',
+                tokenize = 'trigram'
+            );
+        """))
+        conn.execute(sa.text("""
+            CREATE TRIGGER IF NOT EXISTS kandydat_slownik_insert AFTER INSERT ON Kandydat_slownik
+            BEGIN
+                INSERT INTO Kandydat_fts (rowid, imie, nazwisko) VALUES (new.id, new.imie, new.nazwisko);
+            END;
+        """))
+        conn.execute(sa.text("""
+            CREATE TRIGGER IF NOT EXISTS kandydat_slownik_delete AFTER DELETE ON Kandydat_slownik
+            BEGIN
+                INSERT INTO Kandydat_fts (Kandydat_fts, rowid, imie, nazwisko)
+                VALUES ('delete', old.id, old.imie, old.nazwisko);
+            END;
+        """))
+        conn.execute(sa.text("CREATE INDEX IF NOT EXISTS idx_kandydat_nazwisko_imie ON Kandydat (nazwisko, imie);"))
+        conn.execute(sa.text("CREATE INDEX IF NOT EXISTS idx_kandydat_imie_nazwisko ON Kandydat (imie, nazwisko);"))
+
+        # Wartość trafia do słownika przy pierwszym wystąpieniu i jest z niego usuwana,
+        # gdy żaden kandydat już jej nie używa. Liczba wystąpień służy jedynie do wyboru
+        # indeksu przy wyszukiwaniu, więc wystarcza jej przybliżona wartość.
+        dodaj = """
+            UPDATE Kandydat_slownik SET liczba = liczba + 1
+            WHERE kolumna = '{kolumna}' AND wartosc = new.{kolumna};
+            INSERT INTO Kandydat_slownik (kolumna, wartosc, liczba)
+            SELECT '{kolumna}', new.{kolumna}, 1
+            WHERE NOT EXISTS (
+                SELECT 1 FROM Kandydat_slownik WHERE kolumna = '{kolumna}' AND wartosc = new.{kolumna}
+            );
+        """
+        usun = """
+            UPDATE Kandydat_slownik SET liczba = liczba - 1
+            WHERE kolumna = '{kolumna}' AND wartosc = old.{kolumna};
+            DELETE FROM Kandydat_slownik
+            WHERE kolumna = '{kolumna}' AND wartosc = old.{kolumna}
+            AND NOT EXISTS (SELECT 1 FROM Kandydat WHERE {kolumna} = old.{kolumna});
+        """
+        dodaj_oba = "".join(dodaj.format(kolumna = kolumna) for kolumna in ("imie", "nazwisko"))
+        usun_oba = "".join(usun.format(kolumna = kolumna) for kolumna in ("imie", "nazwisko"))
+        conn.execute(sa.text(f"""
+            CREATE TRIGGER IF NOT EXISTS kandydat_slownik_ai AFTER INSERT ON Kandydat
+            BEGIN {dodaj_oba} END;
+        """))
+        conn.execute(sa.text(f"""
+            CREATE TRIGGER IF NOT EXISTS kandydat_slownik_ad AFTER DELETE ON Kandydat
+            BEGIN {usun_oba} END;
+        """))
+        conn.execute(sa.text(f"""
+            CREATE TRIGGER IF NOT EXISTS kandydat_slownik_au AFTER UPDATE OF imie, nazwisko ON Kandydat
+            BEGIN {usun_oba} {dodaj_oba} END;
+        """))
+
+        for kolumna in ("imie", "nazwisko"):
+            conn.execute(sa.text(f"""
+                DELETE FROM Kandydat_slownik
+                WHERE kolumna = '{kolumna}'
+                AND NOT EXISTS (SELECT 1 FROM Kandydat k WHERE k.{kolumna} = Kandydat_slownik.wartosc);
+            """))
+            conn.execute(sa.text(f"""
+                INSERT INTO Kandydat_slownik (kolumna, wartosc, liczba)
+                SELECT '{kolumna}', {kolumna}, count(*) FROM Kandydat WHERE true GROUP BY {kolumna}
+                ON CONFLICT (kolumna, wartosc) DO UPDATE SET liczba = excluded.liczba;
+            """))
+        conn.execute(sa.text("INSERT INTO Kandydat_fts (Kandydat_fts) VALUES ('rebuild');"))
+        conn.execute(sa.text("ANALYZE Kandydat;"))
+        conn.execute(sa.text("ANALYZE Kandydat_slownik;"))
+
+    print("Indeksy wyszukiwania zostały utworzone.")
+
+def _dictionary_query(kolumna, slowo, tryb, parametr):
+    """
+    Zwraca zapytanie o wiersze (wartosc, liczba) słownika kolumny, do których słowo
+    pasuje w podanym trybie lub lepiej (0 - równe, 1 - prefiks, 2 - fragment), i jego parametry.
+    Fragment wyszukiwany jest w tabeli FTS5, prefiks jako zakresy indeksu słownika
+    dla każdego wariantu wielkości liter dwóch pierwszych znaków.
+    """
+    if tryb == 2:
+        query = f"""
+            SELECT s.wartosc, s.liczba
+            FROM Kandydat_fts f
+            JOIN Kandydat_slownik s ON s.id = f.rowid
+            WHERE f.{kolumna} MATCH :{parametr}_fraza
+        """
+        return query, {f"{parametr}_fraza": '"' + slowo.replace('"', '""') + '"'}
+
+    zakresy = []
+    params = {f"{parametr}_kolumna": kolumna, f"{parametr}_wzorzec": search_functions.glob_pattern(slowo, tryb)}
+    for i, (od, do) in enumerate(search_functions.prefix_ranges(slowo)):
+        zakresy.append(f"""
+            SELECT wartosc, liczba FROM Kandydat_slownik
+            WHERE kolumna = :{parametr}_kolumna AND wartosc >= :{parametr}_od{i} AND wartosc < :{parametr}_do{i}
+                AND wartosc GLOB :{parametr}_wzorzec
+        """)
+        params[f"{parametr}_od{i}"] = od
+        params[f"{parametr}_do{i}"] = do
+    return " UNION ALL ".join(zakresy), params
+
+def _match_condition(wyrazenie, slowo, tryb, parametr):
+    """
+    Zwraca warunek SQL dopasowania słowa do wartości wyrażenia w podanym trybie i jego parametry.
+    LIKE uwzględnia wielkość jedynie liter ASCII, dlatego pozostałe litery zastępowane są w nim
+    przez '_', a dokładne dopasowanie sprawdza wzorzec GLOB z wariantami wielkości liter.
+    """
+    wzorzec = "".join("_" if len(search_functions.case_variants(znak)) > 1 and not znak.isascii()
+                      else search_functions.escape_like(znak) for znak in slowo)
+    params = {f"{parametr}_like": {0: wzorzec, 1: wzorzec + "%", 2: "%" + wzorzec + "%"}[tryb]}
+    warunek = f"{wyrazenie} LIKE :{parametr}_like ESCAPE '\\'"
+    if any(len(search_functions.case_variants(znak)) > 1 and not znak.isascii() for znak in slowo):
+        params[f"{parametr}_glob"] = search_functions.glob_pattern(slowo, tryb)
+        warunek = f"({warunek} AND {wyrazenie} GLOB :{parametr}_glob)"
+    return warunek, params
+
+def _search_by_name(conn, fraza, limit):
+    """
+    Zwraca wiersze wyników search_by_name. Fraza złożona z jednej liczby jest prefiksem PESEL,
+    pozostałe frazy wyszukiwane są przez search_functions.search_rows.
+    """
+    columns = """
+    SELECT k.PESEL, k.imie, k.nazwisko, k.sredniamaturalna, w.nazwawydzialu, a.statusaplikacji
+    FROM Kandydat k
+    LEFT JOIN Aplikacja a ON k.PESEL = a.PESEL
+    LEFT JOIN Wydzial w ON a.IDwydzialu = w.IDwydzialu
+    """
+
+    slowa = fraza.split()
+    if len(slowa) == 1 and slowa[0].isdigit():
+        # Prefiks PESEL jako zakres na kluczu głównym.
+        prefiks = slowa[0]
+        query = columns + " WHERE k.pesel >= :od AND k.pesel < :do ORDER BY k.pesel LIMIT :limit"
+        params = {"od": prefiks, "do": prefiks[:-1] + chr(ord(prefiks[-1]) + 1), "limit": limit}
+        return conn.execute(sa.text(query), params).fetchall()
+
+    return search_functions.search_rows(conn, fraza, limit, columns, _dictionary_query, _match_condition)
+
+def _like_search_query(fraza, limit):
+    """
+    Zwraca zapytanie i parametry wyszukiwania kandydatów za pomocą LIKE,
+    bez użycia indeksów. Używana jako punkt odniesienia w benchmark_search.
+    """
+    slowa = fraza.split()
+    query = """
+    SELECT k.PESEL, k.imie, k.nazwisko, k.sredniamaturalna, w.nazwawydzialu, a.statusaplikacji
+    FROM Kandydat k
+    LEFT JOIN Aplikacja a ON k.PESEL = a.PESEL
+    LEFT JOIN Wydzial w ON a.IDwydzialu = w.IDwydzialu
+    """
+
+    if len(slowa) == 1 and slowa[0].isdigit():
+        query += " WHERE k.pesel LIKE :slowo0 ESCAPE '\\'"
+        params = {"slowo0": search_functions.escape_like(slowa[0]) + "%"}
+    else:
+        query += " WHERE " + " AND ".join(
+            f"k.imie || ' ' || k.nazwisko LIKE :slowo{i} ESCAPE '\\'" for i in range(len(slowa)))
+        params = {f"slowo{i}": "%" + search_functions.escape_like(slowo) + "%" for i, slowo in enumerate(slowa)}
+    query += " LIMIT :limit"
+
+    params["limit"] = limit
+    return query, params
+
+def search_by_name(db_file, fraza, limit = 20):
+    """
+    Wyszukuje kandydatów po fragmentach imienia i nazwiska (bez względu na wielkość liter)
+    albo po prefiksie numeru PESEL. Wyniki są uszeregowane według trafności
+    (zob. search_functions.search_rows) i ograniczone do podanej liczby wierszy.
+    Wymaga wcześniejszego wywołania create_search_index.
+    """
+    engine = sa.create_engine(f"sqlite:///{db_file}")
+
+    with engine.connect() as conn:
+        wiersze = _search_by_name(conn, fraza, limit)
+
+    df = pd.DataFrame(wiersze, columns = ["pesel", "imie", "nazwisko", "sredniamaturalna",
+                                          "nazwawydzialu", "statusaplikacji"])
+
+    print("\nWyniki wyszukiwania:")
+    print(df)
+    return df
+
+def benchmark_search(db_file, frazy = search_functions.BENCHMARK_PHRASES, limit = 20, repeats = 20):
+    """
+    Porównuje czas wyszukiwania przez search_by_name z wyszukiwaniem za pomocą LIKE '%...%'.
+    Dla każdej frazy podaje medianę czasu w milisekundach z podanej liczby powtórzeń
+    oraz liczbę zwróconych wierszy. Domyślne frazy obejmują rzadkie imiona z częstymi fragmentami
+    nazwisk (np. "Łucja ski"), które przy dużej liczbie różnych nazwisk są najtrudniejsze dla indeksu.
+    Wymaga wcześniejszego wywołania create_search_index.
+    """
+    engine = sa.create_engine(f"sqlite:///{db_file}")
+
+    with engine.connect() as conn:
+        df = search_functions.benchmark_rows(conn, frazy, limit, repeats, _search_by_name, _like_search_query)
+
+    print("\nCzas wyszukiwania [ms]:")
+    print(df)
+    return df